@@ -1,15 +1,19 @@
 import streamlit as st
 import anthropic
-import json
-from typing import Dict, List
+import orjson
+from typing import Callable, Dict, List, NamedTuple, Optional
 import time
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle
 from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase.pdfmetrics import stringWidth
 import io
+import csv
+import uuid
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Page configuration
 st.set_page_config(
@@ -18,11 +22,257 @@ st.set_page_config(
     layout="wide"
 )
 
+# Oldest analyses are dropped beyond this, so a long session can't grow unbounded
+MAX_HISTORY_ENTRIES = 50
+# Full analysis payloads kept server-side, across all sessions
+MAX_STORED_ANALYSES = 100
+# First-cell values treated as a header row in uploaded company CSVs
+CSV_HEADER_NAMES = {"company", "company name", "company_name", "name", "organization"}
+
 # Initialize session state
 if 'analysis_history' not in st.session_state:
-    st.session_state.analysis_history = []
+    st.session_state.analysis_history = deque(maxlen=MAX_HISTORY_ENTRIES)
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+MODEL_NAME = "claude-sonnet-4-20250514"
+
+# Tool schemas used to get structured output back from the model. Forcing the
+# model to call these tools returns an already-parsed dict instead of free text.
+# The fit fields needed by Step 2 come before the long fit_reasoning so they can
+# be picked up while the rest of the response is still streaming.
+FIT_TOOL = {
+    "name": "record_fit_analysis",
+    "description": "Record the lead qualification analysis for a company.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "company_name": {"type": "string"},
+            "industry": {"type": "string"},
+            "sector": {"type": "string"},
+            "company_size": {"type": "string", "description": "Estimated number of employees"},
+            "brief_company_overview": {"type": "string", "description": "2-3 sentence overview of what the company does"},
+            "is_good_fit": {"type": "boolean"},
+            "fit_score": {"type": "integer", "minimum": 0, "maximum": 100},
+            "fit_reasoning": {"type": "string", "description": "Detailed explanation of why this is or isn't a good fit"}
+        },
+        "required": [
+            "company_name", "industry", "sector", "company_size",
+            "brief_company_overview", "is_good_fit", "fit_score", "fit_reasoning"
+        ]
+    }
+}
+
+PAIN_TOOL = {
+    "name": "record_pain_point_analysis",
+    "description": "Record the pain points, matching solutions and engagement strategy for a company.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "potential_pain_points": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "pain_point": {"type": "string", "description": "Description of the pain point"},
+                        "severity": {"type": "string", "enum": ["high", "medium", "low"]},
+                        "evidence": {"type": "string", "description": "Why we think this is a pain point"}
+                    },
+                    "required": ["pain_point", "severity", "evidence"]
+                }
+            },
+            "how_we_can_help": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "our_solution": {"type": "string", "description": "Which service/capability"},
+                        "addresses_pain_point": {"type": "string", "description": "Which pain point"},
+                        "value_proposition": {"type": "string", "description": "Specific benefit"},
+                        "implementation_approach": {"type": "string", "description": "Brief description"}
+                    },
+                    "required": ["our_solution", "addresses_pain_point", "value_proposition", "implementation_approach"]
+                }
+            },
+            "engagement_strategy": {
+                "type": "object",
+                "properties": {
+                    "primary_contact": {"type": "string", "description": "Suggested role to reach out to"},
+                    "key_talking_points": {"type": "array", "items": {"type": "string"}},
+                    "differentiation_angle": {"type": "string", "description": "What makes our approach unique for them"}
+                },
+                "required": ["primary_contact", "key_talking_points", "differentiation_angle"]
+            },
+            "estimated_opportunity_value": {"type": "string", "enum": ["small", "medium", "large", "enterprise"]},
+            "recommended_next_steps": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": [
+            "potential_pain_points", "how_we_can_help", "engagement_strategy",
+            "estimated_opportunity_value", "recommended_next_steps"
+        ]
+    }
+}
+
+
+# Clients are kept per API key; the cap and expiry stop keys entered once (or
+# mistyped) from holding a connection pool for the life of the server
+@st.cache_resource(show_spinner=False, max_entries=20, ttl=60 * 60)
+def get_anthropic_client(api_key: str) -> anthropic.Anthropic:
+    """
+    Return a shared Anthropic client for the given API key
+
+    The client is cached across reruns and sessions so its HTTP connection
+    pool (and the TLS sessions it holds) is reused between Step 1 and Step 2.
+    HTTP/2 lets concurrent requests share a single pooled connection.
+    """
+    return anthropic.Anthropic(
+        api_key=api_key,
+        http_client=anthropic.DefaultHttpxClient(http2=True),
+        timeout=anthropic.Timeout(120.0, connect=10.0)
+    )
 
-def generate_pdf_report(company_name: str, fit_data: Dict, pain_data: Dict = None) -> bytes:
+
+class TextStyle(NamedTuple):
+    """Font and spacing settings for a block of report text"""
+    font: str
+    size: float
+    color: colors.Color
+    space_before: float = 0
+    space_after: float = 0
+    centered: bool = False
+
+
+# Severity markers for pain points in the PDF report and the Analyze tab
+_SEVERITY_SYMBOL = {'high': '●', 'medium': '▲', 'low': '○'}
+_SEVERITY_COLOR = {"high": "🔴", "medium": "🟡", "low": "🟢"}
+
+# PDF report styles, shared by every report
+_TITLE_STYLE = TextStyle('Helvetica-Bold', 24, colors.HexColor('#1f4788'), space_after=30, centered=True)
+_HEADING_STYLE = TextStyle('Helvetica-Bold', 16, colors.HexColor('#2c5aa0'), space_before=12, space_after=12)
+_SUBHEADING_STYLE = TextStyle('Helvetica-Bold', 13, colors.HexColor('#34495e'), space_before=10, space_after=10)
+_NORMAL_STYLE = TextStyle('Helvetica', 11, colors.HexColor('#2c3e50'), space_after=8)
+_FOOTER_STYLE = TextStyle('Helvetica', 9, colors.grey, centered=True)
+
+
+class PdfReportWriter:
+    """
+    Lays report content out top-to-bottom directly on a reportlab canvas
+    
+    The report has a fixed structure, so instead of the platypus layout engine
+    this keeps a running y cursor, wraps text by measured string width and
+    starts a new page whenever the next line would not fit.
+    """
+    
+    MARGIN_X = inch
+    MARGIN_Y = 0.5*inch
+    TABLE_COL_WIDTHS = (2*inch, 4*inch)
+    TABLE_ROW_HEIGHT = 0.32*inch
+    TABLE_PADDING = 8
+    
+    def __init__(self, buffer: io.BytesIO):
+        self.canvas = canvas.Canvas(buffer, pagesize=letter, pageCompression=1)
+        self.page_width, self.page_height = letter
+        self.text_width = self.page_width - 2 * self.MARGIN_X
+        self.y = self.page_height - self.MARGIN_Y
+    
+    def page_break(self):
+        self.canvas.showPage()
+        self.y = self.page_height - self.MARGIN_Y
+    
+    def space(self, height: float):
+        self.y -= height
+    
+    def _ensure_space(self, height: float):
+        if self.y - height < self.MARGIN_Y:
+            self.page_break()
+    
+    def _wrap(self, text: str, font: str, size: float, first_width: float) -> List[str]:
+        lines = []
+        line = ""
+        width = first_width
+        for word in str(text).split():
+            candidate = f"{line} {word}" if line else word
+            if line and stringWidth(candidate, font, size) > width:
+                lines.append(line)
+                line = word
+                width = self.text_width
+            else:
+                line = candidate
+        lines.append(line)
+        return lines
+    
+    def paragraph(self, text: str, style: TextStyle = _NORMAL_STYLE, label: str = None):
+        """Draw wrapped text, optionally preceded by a bold inline label"""
+        
+        leading = style.size * 1.2
+        label_font = 'Helvetica-Bold'
+        label_width = stringWidth(f"{label} ", label_font, style.size) if label else 0
+        lines = self._wrap(text, style.font, style.size, self.text_width - label_width)
+        
+        self.space(style.space_before)
+        for line_idx, line in enumerate(lines):
+            self._ensure_space(leading)
+            self.y -= style.size
+            self.canvas.setFillColor(style.color)
+            
+            x = self.MARGIN_X
+            if line_idx == 0 and label:
+                self.canvas.setFont(label_font, style.size)
+                self.canvas.drawString(x, self.y, label)
+                x += label_width
+            
+            self.canvas.setFont(style.font, style.size)
+            if style.centered:
+                self.canvas.drawCentredString(self.page_width / 2, self.y, line)
+            else:
+                self.canvas.drawString(x, self.y, line)
+            self.y -= leading - style.size
+        self.space(style.space_after)
+    
+    def metrics_table(self, rows: List[List[str]]):
+        """Draw a fixed-geometry two-column table, the first row being the header"""
+        
+        width = sum(self.TABLE_COL_WIDTHS)
+        height = self.TABLE_ROW_HEIGHT * len(rows)
+        self._ensure_space(height)
+        
+        left = (self.page_width - width) / 2
+        top = self.y
+        value_x = left + self.TABLE_COL_WIDTHS[0] + self.TABLE_PADDING
+        
+        for idx, (label, value) in enumerate(rows):
+            y = top - (idx + 1) * self.TABLE_ROW_HEIGHT
+            is_header = idx == 0
+            
+            self.canvas.setFillColor(colors.HexColor('#2c5aa0') if is_header else colors.beige)
+            self.canvas.rect(left, y, width, self.TABLE_ROW_HEIGHT, stroke=0, fill=1)
+            
+            self.canvas.setFillColor(colors.whitesmoke if is_header else colors.black)
+            self.canvas.setFont('Helvetica-Bold' if is_header else 'Helvetica', 12 if is_header else 10)
+            text_y = y + self.TABLE_ROW_HEIGHT / 2 - 4
+            self.canvas.drawString(left + self.TABLE_PADDING, text_y, label)
+            self.canvas.drawString(value_x, text_y, value)
+        
+        self.canvas.setStrokeColor(colors.grey)
+        self.canvas.setLineWidth(1)
+        self.canvas.grid(
+            [left, left + self.TABLE_COL_WIDTHS[0], left + width],
+            [top - i * self.TABLE_ROW_HEIGHT for i in range(len(rows) + 1)]
+        )
+        self.y = top - height
+    
+    def save(self):
+        self.canvas.save()
+
+
+# Analysis dicts are hashed through orjson, which is much cheaper than
+# Streamlit's default recursive hashing
+@st.cache_data(
+    max_entries=100,
+    show_spinner=False,
+    hash_funcs={dict: lambda d: orjson.dumps(d, option=orjson.OPT_SORT_KEYS)}
+)
+def generate_pdf_report(company_name: str, timestamp: str, fit_data: Dict, pain_data: Dict = None) -> io.BytesIO:
     """
     Generate a professional PDF report of the lead analysis
     
@@ -31,69 +281,34 @@ def generate_pdf_report(company_name: str, fit_data: Dict, pain_data: Dict = Non
     - Pain points and solutions (if available)
     - Engagement strategy
     - Recommended next steps
-    """
     
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    
-    # Container for PDF elements
-    story = []
-    
-    # Define custom styles
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1f4788'),
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
+    Returns a rewound BytesIO, which st.download_button accepts as file-like
+    data. This is a convenience for callers, not a memory saving: the cache
+    stores a pickled copy and download_button still reads the whole buffer.
     
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor('#2c5aa0'),
-        spaceAfter=12,
-        spaceBefore=12,
-        fontName='Helvetica-Bold'
-    )
-    
-    subheading_style = ParagraphStyle(
-        'CustomSubHeading',
-        parent=styles['Heading3'],
-        fontSize=13,
-        textColor=colors.HexColor('#34495e'),
-        spaceAfter=10,
-        spaceBefore=10,
-        fontName='Helvetica-Bold'
-    )
+    Results are cached, so re-rendering a download button for the same
+    analysis (e.g. in the history tab) does not rebuild the PDF. The report
+    is dated with the analysis `timestamp` ("%Y-%m-%d %H:%M:%S") rather than
+    the build time, so a cached report never shows a stale date.
+    """
     
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.HexColor('#2c3e50'),
-        spaceAfter=8,
-        alignment=TA_JUSTIFY
-    )
+    buffer = io.BytesIO()
+    report = PdfReportWriter(buffer)
     
     # Title
-    story.append(Paragraph("Lead Analysis Report", title_style))
-    story.append(Paragraph(f"<b>{company_name}</b>", heading_style))
-    story.append(Paragraph(f"Generated: {time.strftime('%B %d, %Y at %I:%M %p')}", normal_style))
-    story.append(Spacer(1, 0.3*inch))
+    report.paragraph("Lead Analysis Report", _TITLE_STYLE)
+    report.paragraph(company_name, _HEADING_STYLE)
+    generated = time.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+    report.paragraph(f"Generated: {time.strftime('%B %d, %Y at %I:%M %p', generated)}")
+    report.space(0.3*inch)
     
     # Company Overview Section
-    story.append(Paragraph("Company Overview", heading_style))
-    story.append(Paragraph(fit_data['brief_company_overview'], normal_style))
-    story.append(Spacer(1, 0.2*inch))
+    report.paragraph("Company Overview", _HEADING_STYLE)
+    report.paragraph(fit_data['brief_company_overview'])
+    report.space(0.2*inch)
     
     # Fit Analysis Section
-    story.append(Paragraph("Fit Analysis", heading_style))
+    report.paragraph("Fit Analysis", _HEADING_STYLE)
     
     # Create fit metrics table
     fit_data_table = [
@@ -105,153 +320,393 @@ def generate_pdf_report(company_name: str, fit_data: Dict, pain_data: Dict = Non
         ['Good Fit?', 'Yes ✓' if fit_data['is_good_fit'] else 'No ✗']
     ]
     
-    fit_table = Table(fit_data_table, colWidths=[2*inch, 4*inch])
-    fit_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c5aa0')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('PADDING', (0, 0), (-1, -1), 8),
-    ]))
-    
-    story.append(fit_table)
-    story.append(Spacer(1, 0.2*inch))
-    
-    story.append(Paragraph("Fit Assessment Reasoning", subheading_style))
-    story.append(Paragraph(fit_data['fit_reasoning'], normal_style))
-    story.append(Spacer(1, 0.2*inch))
+    report.metrics_table(fit_data_table)
+    report.space(0.2*inch)
+    
+    report.paragraph("Fit Assessment Reasoning", _SUBHEADING_STYLE)
+    report.paragraph(fit_data['fit_reasoning'])
+    report.space(0.2*inch)
     
     # Pain Points and Solutions (if available)
     if pain_data:
-        story.append(PageBreak())
-        story.append(Paragraph("Pain Points Analysis", heading_style))
+        report.page_break()
+        report.paragraph("Pain Points Analysis", _HEADING_STYLE)
         
         for idx, pain in enumerate(pain_data['potential_pain_points'], 1):
-            severity_symbol = {'high': '●', 'medium': '▲', 'low': '○'}
-            symbol = severity_symbol.get(pain['severity'].lower(), '•')
+            symbol = _SEVERITY_SYMBOL.get(pain['severity'].lower(), '•')
             
-            story.append(Paragraph(f"<b>{symbol} Pain Point {idx}: {pain['pain_point']}</b>", subheading_style))
-            story.append(Paragraph(f"<b>Severity:</b> {pain['severity'].upper()}", normal_style))
-            story.append(Paragraph(f"<b>Evidence:</b> {pain['evidence']}", normal_style))
-            story.append(Spacer(1, 0.15*inch))
+            report.paragraph(f"{symbol} Pain Point {idx}: {pain['pain_point']}", _SUBHEADING_STYLE)
+            report.paragraph(pain['severity'].upper(), label="Severity:")
+            report.paragraph(pain['evidence'], label="Evidence:")
+            report.space(0.15*inch)
         
         # Solutions Section
-        story.append(Paragraph("How Can Help", heading_style))
+        report.paragraph("How Can Help", _HEADING_STYLE)
         
         for idx, solution in enumerate(pain_data['how_we_can_help'], 1):
-            story.append(Paragraph(f"<b>Solution {idx}: {solution['our_solution']}</b>", subheading_style))
-            story.append(Paragraph(f"<b>Addresses:</b> {solution['addresses_pain_point']}", normal_style))
-            story.append(Paragraph(f"<b>Value Proposition:</b> {solution['value_proposition']}", normal_style))
-            story.append(Paragraph(f"<b>Implementation Approach:</b> {solution['implementation_approach']}", normal_style))
-            story.append(Spacer(1, 0.15*inch))
+            report.paragraph(f"Solution {idx}: {solution['our_solution']}", _SUBHEADING_STYLE)
+            report.paragraph(solution['addresses_pain_point'], label="Addresses:")
+            report.paragraph(solution['value_proposition'], label="Value Proposition:")
+            report.paragraph(solution['implementation_approach'], label="Implementation Approach:")
+            report.space(0.15*inch)
         
         # Engagement Strategy
-        story.append(PageBreak())
-        story.append(Paragraph("Engagement Strategy", heading_style))
+        report.page_break()
+        report.paragraph("Engagement Strategy", _HEADING_STYLE)
         
         strategy = pain_data['engagement_strategy']
-        story.append(Paragraph(f"<b>Primary Contact:</b> {strategy['primary_contact']}", normal_style))
-        story.append(Paragraph(f"<b>Estimated Opportunity Value:</b> {pain_data['estimated_opportunity_value'].upper()}", normal_style))
-        story.append(Spacer(1, 0.1*inch))
+        report.paragraph(strategy['primary_contact'], label="Primary Contact:")
+        report.paragraph(pain_data['estimated_opportunity_value'].upper(), label="Estimated Opportunity Value:")
+        report.space(0.1*inch)
         
-        story.append(Paragraph("<b>Key Talking Points:</b>", subheading_style))
+        report.paragraph("Key Talking Points:", _SUBHEADING_STYLE)
         for point in strategy['key_talking_points']:
-            story.append(Paragraph(f"• {point}", normal_style))
-        story.append(Spacer(1, 0.1*inch))
+            report.paragraph(f"• {point}")
+        report.space(0.1*inch)
         
-        story.append(Paragraph(f"<b>Differentiation Angle:</b> {strategy['differentiation_angle']}", normal_style))
-        story.append(Spacer(1, 0.2*inch))
+        report.paragraph(strategy['differentiation_angle'], label="Differentiation Angle:")
+        report.space(0.2*inch)
         
         # Next Steps
-        story.append(Paragraph("Recommended Next Steps", heading_style))
+        report.paragraph("Recommended Next Steps", _HEADING_STYLE)
         for idx, step in enumerate(pain_data['recommended_next_steps'], 1):
-            story.append(Paragraph(f"{idx}. {step}", normal_style))
-            story.append(Spacer(1, 0.05*inch))
+            report.paragraph(f"{idx}. {step}")
+            report.space(0.05*inch)
     
     # Footer
-    story.append(Spacer(1, 0.3*inch))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.grey,
-        alignment=TA_CENTER
-    )
-    story.append(Paragraph("Generated by Lead Generation Agent | Powered by Claude AI", footer_style))
+    report.space(0.3*inch)
+    report.paragraph("Generated by Lead Generation Agent | Powered by Claude AI", _FOOTER_STYLE)
     
     # Build PDF
-    doc.build(story)
+    report.save()
     buffer.seek(0)
-    return buffer.getvalue()
+    return buffer
 
 
-def analyze_company_fit(
+class AnalysisStore:
+    """
+    Server-side store of full analysis payloads, keyed by session and analysis id
+    
+    Payloads are capped at MAX_STORED_ANALYSES across the whole server, oldest
+    first, so memory stays bounded however many sessions come and go. Each
+    session also keeps at most MAX_HISTORY_ENTRIES, so its payloads drop out
+    together with the history entries that point at them and one session can
+    never fill the store on its own. Under heavy concurrent use the global cap
+    can still evict a session's older analyses; their history entries then
+    show that the report data is no longer available. Streamlit runs sessions
+    on separate threads, so all access goes through a lock.
+    """
+    
+    def __init__(self):
+        # (session_id, analysis_id) -> payload, oldest first
+        self._entries = OrderedDict()
+        # session_id -> its analysis ids, oldest first
+        self._sessions = {}
+        self._lock = threading.Lock()
+    
+    def _evict(self, session_id: str, analysis_id: str) -> None:
+        self._entries.pop((session_id, analysis_id), None)
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.pop(analysis_id, None)
+            if not session:
+                del self._sessions[session_id]
+    
+    def put(self, session_id: str, analysis_id: str, analysis: Dict) -> None:
+        with self._lock:
+            self._entries[(session_id, analysis_id)] = analysis
+            session = self._sessions.setdefault(session_id, OrderedDict())
+            session[analysis_id] = None
+            if len(session) > MAX_HISTORY_ENTRIES:
+                self._evict(session_id, next(iter(session)))
+            while len(self._entries) > MAX_STORED_ANALYSES:
+                self._evict(*next(iter(self._entries)))
+    
+    def get(self, session_id: str, analysis_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._entries.get((session_id, analysis_id))
+    
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            for analysis_id in list(self._sessions.get(session_id, ())):
+                self._evict(session_id, analysis_id)
+
+
+@st.cache_resource(show_spinner=False)
+def get_analysis_store() -> AnalysisStore:
+    """
+    Return the server-wide store of full analysis payloads
+    
+    Session history only holds a small summary of each analysis; the full fit
+    and pain point data live here and are looked up when a report is needed.
+    """
+    return AnalysisStore()
+
+
+def save_analysis(
+    analysis_id: str,
+    timestamp: str,
     company_name: str,
+    fit_data: Dict,
+    pain_data: Dict = None
+) -> None:
+    """
+    Store the full analysis and add a summary of it to the session history
+    """
+    
+    get_analysis_store().put(
+        st.session_state.session_id,
+        analysis_id,
+        {"fit_data": fit_data, "pain_data": pain_data}
+    )
+    
+    summary = {
+        "id": analysis_id,
+        "timestamp": timestamp,
+        "company_name": company_name,
+        "fit_score": fit_data['fit_score'],
+        "industry": fit_data['industry'],
+        "is_good_fit": fit_data['is_good_fit']
+    }
+    if pain_data:
+        summary.update({
+            "num_pain_points": len(pain_data['potential_pain_points']),
+            "num_solutions": len(pain_data['how_we_can_help']),
+            "opportunity_value": pain_data['estimated_opportunity_value']
+        })
+    st.session_state.analysis_history.append(summary)
+
+
+def get_report_pdf(
+    analysis_id: str,
+    company_name: str,
+    timestamp: str,
+    fit_data: Dict,
+    pain_data: Dict = None
+) -> io.BytesIO:
+    """
+    Return the PDF report for an analysis, building it at most once per session
+    
+    Reports are keyed by analysis id, so the Analyze and History tabs share
+    the same bytes across reruns.
+    """
+    
+    pdf_cache = st.session_state.setdefault("pdf_cache", {})
+    if analysis_id not in pdf_cache:
+        # Drop reports for analyses that have fallen out of the history
+        live_ids = {a['id'] for a in st.session_state.analysis_history}
+        for stale_id in [k for k in pdf_cache if k not in live_ids]:
+            del pdf_cache[stale_id]
+        
+        pdf_cache[analysis_id] = generate_pdf_report(company_name, timestamp, fit_data, pain_data)
+    return pdf_cache[analysis_id]
+
+
+# Static system prompts. They only depend on the sidebar configuration, so they
+# are formatted once per configuration (see build_system_prompts) and reused
+# verbatim as the cacheable prompt prefix for every company.
+_FIT_SYSTEM_TEMPLATE = """You are a lead qualification analyst for a consulting company specializing in data science, AI, and business intelligence.
+
+Our Target Profile:
+- Target Sectors: {sectors}
+- Target Industries: {industries}
+- Our Services: {services}
+
+You will be given a company to analyze. Record your assessment with the record_fit_analysis tool.
+
+Base your analysis on publicly available information about the company. Be thorough and honest in your assessment."""
+
+_PAIN_SYSTEM_TEMPLATE = """You are a business development analyst specializing in data science, AI, and analytics consulting.
+
+Our Services:
+{services}
+
+You will be given information about a company. Provide a comprehensive analysis and record it with the record_pain_point_analysis tool.
+
+Be specific and actionable. Base your analysis on typical challenges in their industry and company profile."""
+
+
+def build_system_prompts(
     target_sectors: List[str],
     target_industries: List[str],
-    our_services: str,
-    api_key: str
+    our_services: str
+) -> Dict[str, str]:
+    """
+    Format the Step 1 and Step 2 system prompts for the current configuration
+    """
+    
+    return {
+        "fit": _FIT_SYSTEM_TEMPLATE.format(
+            sectors=', '.join(target_sectors),
+            industries=', '.join(target_industries),
+            services=our_services
+        ),
+        "pain": _PAIN_SYSTEM_TEMPLATE.format(services=our_services)
+    }
+
+
+def build_fit_request(company_name: str, system_prompt: str) -> Dict:
+    """
+    Build the Messages API parameters for the Step 1 fit analysis
+    
+    Shared by the single-lead and bulk (Message Batches) paths so both
+    send exactly the same request. The system prompt is identical for every
+    company, so it is marked for prompt caching and only the company name is
+    sent as the user message.
+    """
+    
+    return {
+        "model": MODEL_NAME,
+        "max_tokens": 2000,
+        "tools": [FIT_TOOL],
+        "tool_choice": {"type": "tool", "name": FIT_TOOL["name"]},
+        "system": [
+            {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
+        ],
+        "messages": [
+            {"role": "user", "content": f"Company to Analyze: {company_name}"}
+        ]
+    }
+
+
+def build_pain_request(
+    company_name: str,
+    company_overview: str,
+    industry: str,
+    system_prompt: str
 ) -> Dict:
     """
-    Step 1: Analyze if a company is worth pursuing based on target criteria
+    Build the Messages API parameters for the Step 2 pain point analysis
     
-    This function uses Claude to:
-    - Research the company online
-    - Determine if it matches our target sectors/industries
-    - Assess if it's a good fit for our services
+    As in Step 1, the system prompt is cached and the company details are
+    sent as the user message.
     """
     
-    client = anthropic.Anthropic(api_key=api_key)
+    prompt = f"""Company Information:
+- Name: {company_name}
+- Industry: {industry}
+- Overview: {company_overview}"""
+
+    return {
+        "model": MODEL_NAME,
+        "max_tokens": 3000,
+        "tools": [PAIN_TOOL],
+        "tool_choice": {"type": "tool", "name": PAIN_TOOL["name"]},
+        "system": [
+            {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
+        ],
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    }
+
+
+def extract_tool_input(message, tool: Dict) -> Dict:
+    """
+    Return the structured analysis from the model's forced tool call
+    
+    Raises ValueError if the response was cut off or the tool input is missing
+    any of the tool's required fields. A truncated stream still parses into a
+    (partial) dict, so this has to be checked explicitly.
+    """
+    
+    if message.stop_reason == "max_tokens":
+        raise ValueError("Response was cut off at max_tokens before the analysis was complete")
+    
+    analysis = next((block.input for block in message.content if block.type == "tool_use"), None)
+    if analysis is None:
+        raise ValueError(f"Response did not include a {tool['name']} tool call")
     
-    # Construct the analysis prompt
-    prompt = f"""You are a lead qualification analyst for a consulting company specializing in data science, AI, and business intelligence.
+    missing = [field for field in tool["input_schema"]["required"] if field not in analysis]
+    if missing:
+        raise ValueError(f"Analysis is missing required fields: {', '.join(missing)}")
+    
+    return analysis
 
-Our Target Profile:
-- Target Sectors: {', '.join(target_sectors)}
-- Target Industries: {', '.join(target_industries)}
-- Our Services: {our_services}
 
-Company to Analyze: {company_name}
+# Analyses are cached for a day so re-running the same company with the same
+# criteria is instant. Underscore-prefixed arguments are left out of the cache
+# key, and errors are raised rather than returned so they are never cached.
+ANALYSIS_CACHE_TTL = 24 * 60 * 60
+
 
-Please analyze this company and provide a JSON response with the following structure:
+def _stream_company_fit(
+    company_name: str,
+    system_prompt: str,
+    api_key: str,
+    on_snapshot: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    client = get_anthropic_client(api_key)
+    
+    with client.messages.stream(
+        **build_fit_request(company_name, system_prompt)
+    ) as stream:
+        for event in stream:
+            if on_snapshot is not None and event.type == "input_json":
+                on_snapshot(event.snapshot)
+        
+        message = stream.get_final_message()
+    
+    return extract_tool_input(message, FIT_TOOL)
 
-{{
-    "company_name": "string",
-    "industry": "string",
-    "sector": "string",
-    "company_size": "string (estimated employees)",
-    "is_good_fit": true/false,
-    "fit_score": 0-100,
-    "fit_reasoning": "detailed explanation of why this is or isn't a good fit",
-    "brief_company_overview": "2-3 sentence overview of what the company does"
-}}
 
-Base your analysis on publicly available information about the company. Be thorough and honest in your assessment.
+@st.cache_data(ttl=ANALYSIS_CACHE_TTL, show_spinner=False)
+def _cached_company_fit(
+    company_name: str,
+    system_prompt: str,
+    _analysis: Optional[Dict] = None
+) -> Dict:
+    # The stream updates the page as it arrives, which a cached function is
+    # not allowed to do, so this only holds the finished analysis. A lookup
+    # with nothing stored raises, and errors are never cached.
+    if _analysis is None:
+        raise LookupError(company_name)
+    return _analysis
 
-IMPORTANT: Respond ONLY with valid JSON. Do not include any text outside the JSON structure."""
 
+@st.cache_data(ttl=ANALYSIS_CACHE_TTL, show_spinner=False)
+def _fetch_pain_point_analysis(
+    company_name: str,
+    company_overview: str,
+    industry: str,
+    system_prompt: str,
+    _api_key: str
+) -> Dict:
+    client = get_anthropic_client(_api_key)
+    
+    message = client.messages.create(
+        **build_pain_request(company_name, company_overview, industry, system_prompt)
+    )
+    
+    return extract_tool_input(message, PAIN_TOOL)
+
+
+def analyze_company_fit(
+    company_name: str,
+    system_prompt: str,
+    api_key: str,
+    on_snapshot: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Step 1: Analyze if a company is worth pursuing based on target criteria
+    
+    This function uses Claude to:
+    - Research the company online
+    - Determine if it matches our target sectors/industries
+    - Assess if it's a good fit for our services
+    
+    The response is streamed on the calling thread. If `on_snapshot` is given,
+    it is called with the partial analysis every time more of it arrives, so
+    the page can show fields and start Step 2 before the rest has finished
+    generating. It is not called when the result comes from the cache.
+    """
+    
     try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=2000,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        # Extract and parse the JSON response
-        response_text = message.content[0].text.strip()
-        # Remove markdown code blocks if present
-        if response_text.startswith("```json"):
-            response_text = response_text.replace("```json", "").replace("```", "").strip()
-        
-        analysis = json.loads(response_text)
+        try:
+            analysis = _cached_company_fit(company_name, system_prompt)
+        except LookupError:
+            analysis = _stream_company_fit(company_name, system_prompt, api_key, on_snapshot)
+            _cached_company_fit(company_name, system_prompt, analysis)
         return {"success": True, "data": analysis}
         
     except Exception as e:
@@ -262,7 +717,7 @@ def generate_pain_point_analysis(
     company_name: str,
     company_overview: str,
     industry: str,
-    our_services: str,
+    system_prompt: str,
     api_key: str
 ) -> Dict:
     """
@@ -274,69 +729,163 @@ def generate_pain_point_analysis(
     - Suggests approach strategies
     """
     
-    client = anthropic.Anthropic(api_key=api_key)
-    
-    prompt = f"""You are a business development analyst specializing in data science, AI, and analytics consulting.
-
-Company Information:
-- Name: {company_name}
-- Industry: {industry}
-- Overview: {company_overview}
-
-Our Services:
-{our_services}
-
-Please provide a comprehensive analysis in JSON format:
-
-{{
-    "potential_pain_points": [
-        {{
-            "pain_point": "description",
-            "severity": "high/medium/low",
-            "evidence": "why we think this is a pain point"
-        }}
-    ],
-    "how_we_can_help": [
-        {{
-            "our_solution": "which service/capability",
-            "addresses_pain_point": "which pain point",
-            "value_proposition": "specific benefit",
-            "implementation_approach": "brief description"
-        }}
-    ],
-    "engagement_strategy": {{
-        "primary_contact": "suggested role to reach out to",
-        "key_talking_points": ["point1", "point2", "point3"],
-        "differentiation_angle": "what makes our approach unique for them"
-    }},
-    "estimated_opportunity_value": "small/medium/large/enterprise",
-    "recommended_next_steps": ["step1", "step2", "step3"]
-}}
-
-Be specific and actionable. Base your analysis on typical challenges in their industry and company profile.
-
-IMPORTANT: Respond ONLY with valid JSON. Do not include any text outside the JSON structure."""
-
     try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=3000,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+        analysis = _fetch_pain_point_analysis(
+            company_name, company_overview, industry, system_prompt, api_key
         )
-        
-        response_text = message.content[0].text.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text.replace("```json", "").replace("```", "").strip()
-        
-        analysis = json.loads(response_text)
         return {"success": True, "data": analysis}
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+def submit_message_batch(requests: Dict[str, Dict], api_key: str) -> str:
+    """
+    Submit requests through the Message Batches API and return the batch id
+    
+    `requests` maps a custom_id to its Messages API parameters.
+    """
+    
+    client = get_anthropic_client(api_key)
+    
+    batch = client.messages.batches.create(
+        requests=[{"custom_id": custom_id, "params": params} for custom_id, params in requests.items()]
+    )
+    return batch.id
+
+
+def get_message_batch_results(batch_id: str, tool: Dict, api_key: str) -> Optional[Dict[str, Dict]]:
+    """
+    Return the results of a batch, or None while it is still processing
+    
+    Results map each custom_id to a {"success", "data"/"error"} result, in the
+    same shape as the single-lead analysis functions. Every request in the
+    batch must use `tool`.
+    """
+    
+    client = get_anthropic_client(api_key)
+    
+    batch = client.messages.batches.retrieve(batch_id)
+    if batch.processing_status != "ended":
+        return None
+    
+    results = {}
+    for entry in client.messages.batches.results(batch_id):
+        if entry.result.type != "succeeded":
+            results[entry.custom_id] = {"success": False, "error": f"Batch request {entry.result.type}"}
+            continue
+        
+        try:
+            results[entry.custom_id] = {"success": True, "data": extract_tool_input(entry.result.message, tool)}
+        except Exception as e:
+            results[entry.custom_id] = {"success": False, "error": str(e)}
+    
+    return results
+
+
+def start_bulk_analysis(
+    company_names: List[str],
+    system_prompts: Dict[str, str],
+    api_key: str
+) -> Dict:
+    """
+    Submit the Step 1 batch for many companies and return the bulk job
+    
+    Each company is still its own request; only the submission is batched.
+    The job is a plain dict meant to live in st.session_state, so a batch that
+    takes a long time can be checked on across reruns with
+    advance_bulk_analysis.
+    """
+    
+    # Batch custom_ids are restricted to [a-zA-Z0-9_-], so index by position
+    fit_requests = {
+        f"fit-{idx}": build_fit_request(name, system_prompts["fit"])
+        for idx, name in enumerate(company_names)
+    }
+    
+    return {
+        "company_names": company_names,
+        "pain_system_prompt": system_prompts["pain"],
+        "stage": "fit",
+        "batch_id": submit_message_batch(fit_requests, api_key),
+        "fit_results": {},
+        "pain_results": {}
+    }
+
+
+def advance_bulk_analysis(job: Dict, api_key: str) -> None:
+    """
+    Check on a bulk job's current batch and move it to the next stage if done
+    
+    Once the Step 1 batch has ended, a second batch runs Step 2 for the
+    companies that came back as a good fit. The job is updated in place and
+    its stage ends up as "done".
+    """
+    
+    if job["stage"] == "fit":
+        fit_results = get_message_batch_results(job["batch_id"], FIT_TOOL, api_key)
+        if fit_results is None:
+            return
+        job["fit_results"] = fit_results
+        
+        pain_requests = {}
+        for idx, name in enumerate(job["company_names"]):
+            fit_result = fit_results.get(f"fit-{idx}")
+            if fit_result and fit_result["success"] and fit_result["data"]["is_good_fit"]:
+                fit_data = fit_result["data"]
+                pain_requests[f"pain-{idx}"] = build_pain_request(
+                    name,
+                    fit_data['brief_company_overview'],
+                    fit_data['industry'],
+                    job["pain_system_prompt"]
+                )
+        
+        if pain_requests:
+            job["batch_id"] = submit_message_batch(pain_requests, api_key)
+            job["stage"] = "pain"
+        else:
+            job["stage"] = "done"
+    
+    elif job["stage"] == "pain":
+        pain_results = get_message_batch_results(job["batch_id"], PAIN_TOOL, api_key)
+        if pain_results is None:
+            return
+        job["pain_results"] = pain_results
+        job["stage"] = "done"
+
+
+def get_bulk_results(job: Dict) -> List[Dict]:
+    """
+    Return the per-company results of a finished bulk job
+    """
+    
+    return [
+        {
+            "company_name": name,
+            "fit_result": job["fit_results"].get(f"fit-{idx}", {"success": False, "error": "No result returned"}),
+            "pain_result": job["pain_results"].get(f"pain-{idx}")
+        }
+        for idx, name in enumerate(job["company_names"])
+    ]
+
+
+def parse_company_csv(data: bytes) -> List[str]:
+    """
+    Return the company names from the first column of an uploaded CSV
+    
+    Excel's "CSV UTF-8" export starts with a byte order mark, which is
+    stripped so a header row such as "Company" is still recognised and
+    skipped. Raises UnicodeDecodeError for files that are not UTF-8.
+    """
+    
+    text = data.decode("utf-8-sig")
+    rows = [row for row in csv.reader(io.StringIO(text)) if row and row[0].strip()]
+    # Skip a header row such as "Company" or "Company Name"
+    if rows and rows[0][0].strip().lower() in CSV_HEADER_NAMES:
+        rows = rows[1:]
+    return [row[0].strip() for row in rows]
+
+
 # UI Layout
 st.title("📊 Lead Generation Agent")
 st.markdown("**Intelligent lead qualification and analysis powered by AI**")
@@ -388,9 +937,23 @@ with st.sidebar:
 - Advanced Analytics & Business Intelligence""",
         height=250
     )
+    
+    # Rebuild the system prompts only when the configuration changes
+    prompt_config = (tuple(target_sectors), tuple(target_industries), our_services)
+    if st.session_state.get("prompt_config") != prompt_config:
+        st.session_state.prompt_config = prompt_config
+        st.session_state.system_prompts = build_system_prompts(target_sectors, target_industries, our_services)
+    system_prompts = st.session_state.system_prompts
+    
+    st.markdown("---")
+    
+    if st.button("🗑️ Clear History", use_container_width=True):
+        get_analysis_store().clear(st.session_state.session_id)
+        st.session_state.analysis_history.clear()
+        st.session_state.pop("pdf_cache", None)
 
 # Main content area
-tab1, tab2 = st.tabs(["🔍 Analyze New Lead", "📚 Analysis History"])
+tab1, tab2, tab3 = st.tabs(["🔍 Analyze New Lead", "📚 Analysis History", "📦 Bulk Analyze"])
 
 with tab1:
     st.header("Analyze a New Company")
@@ -413,69 +976,109 @@ with tab1:
         elif not company_name:
             st.error("⚠️ Please enter a company name")
         else:
-            # Step 1: Initial fit analysis
-            with st.spinner(f"🔍 Step 1/2: Analyzing if {company_name} is a good fit..."):
-                fit_result = analyze_company_fit(
+            # Step 1 streams on this thread so its results show up as they
+            # arrive; Step 2 is network-bound and runs on a worker thread as
+            # soon as the fit decision is known
+            executor = ThreadPoolExecutor(max_workers=1)
+            pain_futures = []
+            
+            step1_status = st.empty()
+            step1_status.info(f"🔍 Step 1/2: Analyzing if {company_name} is a good fit...")
+            col1, col2, col3 = st.columns(3)
+            fit_metrics = (col1.empty(), col2.empty(), col3.empty())
+            
+            def show_fit_metrics(fit: Dict) -> None:
+                score_metric, industry_metric, status_metric = fit_metrics
+                if 'fit_score' in fit:
+                    score_metric.metric("Fit Score", f"{fit['fit_score']}/100")
+                if 'industry' in fit:
+                    industry_metric.metric("Industry", fit['industry'])
+                if 'is_good_fit' in fit:
+                    fit_status = "✅ Good Fit" if fit['is_good_fit'] else "❌ Poor Fit"
+                    status_metric.metric("Status", fit_status)
+            
+            def start_pain_analysis(fit: Dict) -> None:
+                pain_futures.append(executor.submit(
+                    generate_pain_point_analysis,
                     company_name,
-                    target_sectors,
-                    target_industries,
-                    our_services,
+                    fit['brief_company_overview'],
+                    fit['industry'],
+                    system_prompts["pain"],
                     api_key
-                )
+                ))
+            
+            completed_fields = set()
+            decision_fields = {"industry", "brief_company_overview", "is_good_fit"}
+            
+            def on_fit_snapshot(partial_fit: Dict) -> None:
+                # A field is only final once a later key has started streaming
+                complete = {key: partial_fit[key] for key in list(partial_fit)[:-1]}
+                if complete.keys() == completed_fields:
+                    return
+                completed_fields.update(complete)
+                
+                show_fit_metrics(complete)
+                if not pain_futures and decision_fields.issubset(complete) and complete['is_good_fit']:
+                    start_pain_analysis(complete)
+            
+            # Step 1: Initial fit analysis
+            fit_result = analyze_company_fit(
+                company_name,
+                system_prompts["fit"],
+                api_key,
+                on_fit_snapshot
+            )
             
             if not fit_result["success"]:
+                # A Step 2 request started while streaming is abandoned rather
+                # than waited on, so the error shows (and the page finishes
+                # rendering) straight away
+                executor.shutdown(wait=False, cancel_futures=True)
+                step1_status.empty()
+                for placeholder in fit_metrics:
+                    placeholder.empty()
                 st.error(f"❌ Error in fit analysis: {fit_result['error']}")
             else:
                 fit_data = fit_result["data"]
-                
+                analysis_id = uuid.uuid4().hex
+                analysis_timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            
+                # Start Step 2 now if it was not started while streaming
+                # (e.g. the fit analysis came from the cache)
+                if not pain_futures and fit_data['is_good_fit']:
+                    start_pain_analysis(fit_data)
+                pain_future = pain_futures[0] if pain_futures else None
+                executor.shutdown(wait=False)
+            
                 # Display fit analysis results
-                st.success("✅ Step 1 Complete: Fit Analysis")
-                
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Fit Score", f"{fit_data['fit_score']}/100")
-                with col2:
-                    st.metric("Industry", fit_data['industry'])
-                with col3:
-                    fit_status = "✅ Good Fit" if fit_data['is_good_fit'] else "❌ Poor Fit"
-                    st.metric("Status", fit_status)
-                
+                step1_status.success("✅ Step 1 Complete: Fit Analysis")
+                show_fit_metrics(fit_data)
+            
                 st.subheader("Company Overview")
                 st.info(fit_data['brief_company_overview'])
-                
+            
                 st.subheader("Fit Assessment")
                 st.write(fit_data['fit_reasoning'])
-                
+            
                 # Step 2: Pain point analysis (only if good fit)
-                if fit_data['is_good_fit']:
+                if pain_future is not None:
                     with st.spinner(f"🎯 Step 2/2: Analyzing pain points and opportunities..."):
-                        pain_result = generate_pain_point_analysis(
-                            company_name,
-                            fit_data['brief_company_overview'],
-                            fit_data['industry'],
-                            our_services,
-                            api_key
-                        )
-                    
+                        pain_result = pain_future.result()
+                
                     if not pain_result["success"]:
                         st.error(f"❌ Error in pain point analysis: {pain_result['error']}")
                     else:
                         pain_data = pain_result["data"]
-                        
+                    
                         st.success("✅ Step 2 Complete: Pain Point Analysis")
-                        
+                    
                         # Display pain points
                         st.subheader("🎯 Identified Pain Points")
                         for idx, pain in enumerate(pain_data['potential_pain_points'], 1):
-                            severity_color = {
-                                "high": "🔴",
-                                "medium": "🟡",
-                                "low": "🟢"
-                            }
-                            with st.expander(f"{severity_color.get(pain['severity'].lower(), '⚪')} {pain['pain_point']}"):
+                            with st.expander(f"{_SEVERITY_COLOR.get(pain['severity'].lower(), '⚪')} {pain['pain_point']}"):
                                 st.write(f"**Severity:** {pain['severity'].upper()}")
                                 st.write(f"**Evidence:** {pain['evidence']}")
-                        
+                    
                         # Display solutions
                         st.subheader("💡 How We Can Help")
                         for idx, solution in enumerate(pain_data['how_we_can_help'], 1):
@@ -483,46 +1086,41 @@ with tab1:
                                 st.write(f"**Addresses:** {solution['addresses_pain_point']}")
                                 st.write(f"**Value Proposition:** {solution['value_proposition']}")
                                 st.write(f"**Approach:** {solution['implementation_approach']}")
-                        
+                    
                         # Engagement strategy
                         st.subheader("📋 Engagement Strategy")
                         strategy = pain_data['engagement_strategy']
-                        
+                    
                         col1, col2 = st.columns(2)
                         with col1:
                             st.write(f"**Primary Contact:** {strategy['primary_contact']}")
                             st.write(f"**Opportunity Value:** {pain_data['estimated_opportunity_value'].upper()}")
-                        
+                    
                         with col2:
                             st.write("**Key Talking Points:**")
                             for point in strategy['key_talking_points']:
                                 st.write(f"- {point}")
-                        
+                    
                         st.write(f"**Differentiation:** {strategy['differentiation_angle']}")
-                        
+                    
                         st.subheader("✅ Recommended Next Steps")
                         for idx, step in enumerate(pain_data['recommended_next_steps'], 1):
                             st.write(f"{idx}. {step}")
-                        
+                    
                         # Save to history
-                        st.session_state.analysis_history.append({
-                            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                            "company_name": company_name,
-                            "fit_data": fit_data,
-                            "pain_data": pain_data
-                        })
-                        
+                        save_analysis(analysis_id, analysis_timestamp, company_name, fit_data, pain_data)
+                    
                         st.success("💾 Analysis saved to history!")
-                        
+                    
                         # PDF Export Button
                         st.markdown("---")
                         st.subheader("📄 Export Report")
-                        
+                    
                         try:
-                            pdf_bytes = generate_pdf_report(company_name, fit_data, pain_data)
+                            pdf_buffer = get_report_pdf(analysis_id, company_name, analysis_timestamp, fit_data, pain_data)
                             st.download_button(
                                 label="📥 Download PDF Report",
-                                data=pdf_bytes,
+                                data=pdf_buffer,
                                 file_name=f"Lead_Analysis_{company_name.replace(' ', '_')}_{time.strftime('%Y%m%d')}.pdf",
                                 mime="application/pdf",
                                 type="primary",
@@ -530,19 +1128,19 @@ with tab1:
                             )
                         except Exception as e:
                             st.error(f"Error generating PDF: {str(e)}")
-                
+            
                 else:
                     st.warning("⚠️ This company is not a good fit based on our target criteria. Pain point analysis skipped.")
-                    
+                
                     # Still offer PDF export for rejected leads
                     st.markdown("---")
                     st.subheader("📄 Export Report")
-                    
+                
                     try:
-                        pdf_bytes = generate_pdf_report(company_name, fit_data, None)
+                        pdf_buffer = get_report_pdf(analysis_id, company_name, analysis_timestamp, fit_data, None)
                         st.download_button(
                             label="📥 Download PDF Report",
-                            data=pdf_bytes,
+                            data=pdf_buffer,
                             file_name=f"Lead_Analysis_{company_name.replace(' ', '_')}_{time.strftime('%Y%m%d')}.pdf",
                             mime="application/pdf",
                             type="secondary",
@@ -557,38 +1155,159 @@ with tab2:
     if not st.session_state.analysis_history:
         st.info("No analyses yet. Analyze your first lead in the 'Analyze New Lead' tab!")
     else:
-        for idx, analysis in enumerate(reversed(st.session_state.analysis_history)):
+        for analysis in reversed(st.session_state.analysis_history):
             with st.expander(f"📊 {analysis['company_name']} - {analysis['timestamp']}"):
                 col1, col2 = st.columns([3, 1])
                 
                 with col1:
-                    st.write(f"**Fit Score:** {analysis['fit_data']['fit_score']}/100")
-                    st.write(f"**Industry:** {analysis['fit_data']['industry']}")
-                    st.write(f"**Good Fit:** {'Yes' if analysis['fit_data']['is_good_fit'] else 'No'}")
+                    st.write(f"**Fit Score:** {analysis['fit_score']}/100")
+                    st.write(f"**Industry:** {analysis['industry']}")
+                    st.write(f"**Good Fit:** {'Yes' if analysis['is_good_fit'] else 'No'}")
                     
-                    if 'pain_data' in analysis:
-                        st.write(f"**Pain Points Identified:** {len(analysis['pain_data']['potential_pain_points'])}")
-                        st.write(f"**Solutions Proposed:** {len(analysis['pain_data']['how_we_can_help'])}")
-                        st.write(f"**Opportunity Value:** {analysis['pain_data']['estimated_opportunity_value']}")
+                    if 'num_pain_points' in analysis:
+                        st.write(f"**Pain Points Identified:** {analysis['num_pain_points']}")
+                        st.write(f"**Solutions Proposed:** {analysis['num_solutions']}")
+                        st.write(f"**Opportunity Value:** {analysis['opportunity_value']}")
                 
                 with col2:
-                    # Export button for historical analysis
+                    # Reports are only built on request, so rendering the
+                    # history does not generate a PDF per entry
                     try:
-                        pdf_bytes = generate_pdf_report(
-                            analysis['company_name'], 
-                            analysis['fit_data'], 
-                            analysis.get('pain_data')
-                        )
-                        st.download_button(
-                            label="📥 PDF",
-                            data=pdf_bytes,
-                            file_name=f"Lead_Analysis_{analysis['company_name'].replace(' ', '_')}_{time.strftime('%Y%m%d')}.pdf",
-                            mime="application/pdf",
-                            key=f"pdf_export_{idx}"
-                        )
+                        pdf_buffer = st.session_state.get("pdf_cache", {}).get(analysis['id'])
+                        if pdf_buffer is None:
+                            full_analysis = get_analysis_store().get(st.session_state.session_id, analysis['id'])
+                            if full_analysis is None:
+                                st.caption("Report data no longer available")
+                            elif st.button("📥 Prepare PDF", key=f"pdf_prepare_{analysis['id']}"):
+                                pdf_buffer = get_report_pdf(
+                                    analysis['id'],
+                                    analysis['company_name'], 
+                                    analysis['timestamp'],
+                                    full_analysis['fit_data'], 
+                                    full_analysis['pain_data']
+                                )
+                        
+                        if pdf_buffer is not None:
+                            st.download_button(
+                                label="📥 PDF",
+                                data=pdf_buffer,
+                                file_name=f"Lead_Analysis_{analysis['company_name'].replace(' ', '_')}_{time.strftime('%Y%m%d')}.pdf",
+                                mime="application/pdf",
+                                key=f"pdf_export_{analysis['id']}"
+                            )
                     except Exception as e:
                         st.error(f"PDF Error: {str(e)}")
 
+with tab3:
+    st.header("Bulk Analyze Companies")
+    st.write("Qualify many leads at once through the Message Batches API. Batches are cheaper than individual requests but can take several minutes to complete.")
+    
+    bulk_input = st.text_area(
+        "Company names (one per line)",
+        placeholder="TechCorp Inc.\nAcme Solutions",
+        height=150
+    )
+    bulk_file = st.file_uploader(
+        "...or upload a CSV (company names in the first column)",
+        type=["csv", "txt"]
+    )
+    
+    company_names = [c.strip() for c in bulk_input.split("\n") if c.strip()]
+    if bulk_file is not None:
+        try:
+            company_names.extend(parse_company_csv(bulk_file.getvalue()))
+        except UnicodeDecodeError:
+            st.error("⚠️ Could not read the CSV. Please save it as UTF-8 (in Excel: \"CSV UTF-8\") and upload it again.")
+    # Drop duplicates but keep the original order
+    company_names = list(dict.fromkeys(company_names))
+    
+    bulk_job = st.session_state.get("bulk_job")
+    job_running = bulk_job is not None and bulk_job["stage"] != "done"
+    
+    bulk_button = st.button("🚀 Bulk Analyze", type="primary", disabled=not company_names or job_running)
+    
+    if bulk_button:
+        if not api_key:
+            st.error("⚠️ Please enter your Claude API key in the sidebar")
+        else:
+            try:
+                with st.spinner(f"📦 Submitting {len(company_names)} companies for batch analysis..."):
+                    bulk_job = start_bulk_analysis(company_names, system_prompts, api_key)
+                st.session_state.bulk_job = bulk_job
+            except Exception as e:
+                st.error(f"❌ Error in bulk analysis: {str(e)}")
+    
+    if bulk_job is not None and bulk_job["stage"] != "done":
+        step = "Step 1/2: fit analysis" if bulk_job["stage"] == "fit" else "Step 2/2: pain point analysis"
+        st.info(f"📦 Batch `{bulk_job['batch_id']}` is processing ({step}) for {len(bulk_job['company_names'])} companies. Check back in a few minutes.")
+        
+        if st.button("🔄 Check Status"):
+            if not api_key:
+                st.error("⚠️ Please enter your Claude API key in the sidebar")
+            else:
+                try:
+                    with st.spinner("Checking batch status..."):
+                        advance_bulk_analysis(bulk_job, api_key)
+                except Exception as e:
+                    st.error(f"❌ Error checking batch status: {str(e)}")
+                else:
+                    if bulk_job["stage"] != "done":
+                        st.write("⏳ Still processing.")
+    
+    if bulk_job is not None and bulk_job["stage"] == "done":
+        summary_rows = []
+        bulk_results = get_bulk_results(bulk_job)
+        for result in bulk_results:
+            fit_result = result["fit_result"]
+            pain_result = result["pain_result"]
+            
+            # One bad result shouldn't take the rest of the batch down with it
+            try:
+                if not fit_result["success"]:
+                    summary_rows.append({
+                        "Company": result["company_name"],
+                        "Status": f"Error: {fit_result['error']}"
+                    })
+                    continue
+                
+                fit_data = fit_result["data"]
+                pain_data = pain_result["data"] if pain_result and pain_result["success"] else None
+                
+                if pain_data:
+                    opportunity_value = pain_data['estimated_opportunity_value']
+                elif fit_data['is_good_fit']:
+                    opportunity_value = f"Error: {pain_result['error'] if pain_result else 'No result returned'}"
+                else:
+                    opportunity_value = ""
+                
+                summary_rows.append({
+                    "Company": result["company_name"],
+                    "Status": "✅ Good Fit" if fit_data['is_good_fit'] else "❌ Poor Fit",
+                    "Fit Score": fit_data['fit_score'],
+                    "Industry": fit_data['industry'],
+                    "Opportunity Value": opportunity_value
+                })
+                
+                # Save to history (once) so reports can be exported from the history tab
+                if not bulk_job.get("saved"):
+                    save_analysis(
+                        uuid.uuid4().hex,
+                        time.strftime("%Y-%m-%d %H:%M:%S"),
+                        result["company_name"],
+                        fit_data,
+                        pain_data
+                    )
+            except Exception as e:
+                summary_rows.append({
+                    "Company": result["company_name"],
+                    "Status": f"Error: {str(e)}"
+                })
+        bulk_job["saved"] = True
+        
+        st.success(f"✅ Bulk analysis complete: {len(bulk_results)} companies processed")
+        st.dataframe(summary_rows, use_container_width=True)
+        st.info("💾 Results saved to history. Export individual reports from the 'Analysis History' tab.")
+
 # Footer
 st.markdown("---")
 st.markdown(
@@ -0,0 +1,276 @@
+"""
+Tests for the non-UI parts of lead_gen.py
+
+lead_gen.py is a Streamlit script rather than an importable module, so it is
+executed once in bare mode (no page is served) and its functions are taken
+from the resulting globals. Patching those globals patches what the
+functions see. No request ever reaches the Anthropic API.
+
+Run with: python -m unittest discover tests
+"""
+
+import io
+import os
+import runpy
+import unittest
+from types import SimpleNamespace
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lead_gen.py")
+
+app = None
+
+
+def setUpModule():
+    global app
+    # run_path returns a copy of the script's globals; the functions' own
+    # __globals__ is the namespace they actually look names up in
+    app = runpy.run_path(APP_PATH)["build_fit_request"].__globals__
+
+
+def complete_fit(**overrides):
+    fit = {
+        "company_name": "Acme",
+        "industry": "Software",
+        "sector": "Technology",
+        "company_size": "200",
+        "brief_company_overview": "Acme builds analytics tools.",
+        "is_good_fit": True,
+        "fit_score": 82,
+        "fit_reasoning": "Data-heavy product company in a target industry."
+    }
+    fit.update(overrides)
+    return fit
+
+
+def complete_pain():
+    return {
+        "potential_pain_points": [
+            {"pain_point": "Siloed R&D <legacy> data", "severity": "high", "evidence": "Mergers & acquisitions"}
+        ],
+        "how_we_can_help": [
+            {
+                "our_solution": "Data Engineering",
+                "addresses_pain_point": "Siloed R&D <legacy> data",
+                "value_proposition": "One source of truth",
+                "implementation_approach": "Consolidate pipelines"
+            }
+        ],
+        "engagement_strategy": {
+            "primary_contact": "VP of Data",
+            "key_talking_points": ["Cost < current spend", "Q&A workshop"],
+            "differentiation_angle": "Industry experience"
+        },
+        "estimated_opportunity_value": "medium",
+        "recommended_next_steps": ["Intro call"]
+    }
+
+
+def tool_message(tool_input, stop_reason="tool_use"):
+    return SimpleNamespace(
+        stop_reason=stop_reason,
+        content=[SimpleNamespace(type="tool_use", input=tool_input)]
+    )
+
+
+class ExtractToolInputTests(unittest.TestCase):
+    def test_returns_complete_input(self):
+        fit = complete_fit()
+        self.assertEqual(app["extract_tool_input"](tool_message(fit), app["FIT_TOOL"]), fit)
+
+    def test_rejects_response_cut_off_at_max_tokens(self):
+        message = tool_message(complete_fit(), stop_reason="max_tokens")
+        with self.assertRaisesRegex(ValueError, "max_tokens"):
+            app["extract_tool_input"](message, app["FIT_TOOL"])
+
+    def test_rejects_missing_required_fields(self):
+        truncated = {"company_name": "Acme", "industry": "Software"}
+        with self.assertRaisesRegex(ValueError, "fit_score"):
+            app["extract_tool_input"](tool_message(truncated), app["FIT_TOOL"])
+
+    def test_rejects_response_without_tool_call(self):
+        message = SimpleNamespace(stop_reason="end_turn", content=[SimpleNamespace(type="text", text="Sorry")])
+        with self.assertRaisesRegex(ValueError, "record_fit_analysis"):
+            app["extract_tool_input"](message, app["FIT_TOOL"])
+
+
+class FakeBatches:
+    """Message Batches stand-in that ends each batch on its second retrieve"""
+
+    def __init__(self, responses):
+        # custom_id -> (tool input, stop_reason)
+        self.responses = responses
+        self.batches = {}
+
+    def create(self, requests):
+        batch_id = f"msgbatch_{len(self.batches)}"
+        self.batches[batch_id] = {"requests": requests, "retrieved": 0}
+        return SimpleNamespace(id=batch_id)
+
+    def retrieve(self, batch_id):
+        batch = self.batches[batch_id]
+        batch["retrieved"] += 1
+        return SimpleNamespace(processing_status="ended" if batch["retrieved"] > 1 else "in_progress")
+
+    def results(self, batch_id):
+        for request in self.batches[batch_id]["requests"]:
+            tool_input, stop_reason = self.responses[request["custom_id"]]
+            yield SimpleNamespace(
+                custom_id=request["custom_id"],
+                result=SimpleNamespace(type="succeeded", message=tool_message(tool_input, stop_reason))
+            )
+
+
+class BulkAnalysisTests(unittest.TestCase):
+    def setUp(self):
+        self.batches = FakeBatches({
+            "fit-0": (complete_fit(company_name="Acme"), "tool_use"),
+            "fit-1": ({"company_name": "Cut Off", "industry": "Retail"}, "max_tokens"),
+            "fit-2": ({"company_name": "Partial", "is_good_fit": True}, "tool_use"),
+            "pain-0": (complete_pain(), "tool_use")
+        })
+        client = SimpleNamespace(messages=SimpleNamespace(batches=self.batches))
+        original = app["get_anthropic_client"]
+        app["get_anthropic_client"] = lambda api_key: client
+        self.addCleanup(app.__setitem__, "get_anthropic_client", original)
+
+    def run_job(self):
+        job = app["start_bulk_analysis"](
+            ["Acme", "Cut Off", "Partial"], {"fit": "fit prompt", "pain": "pain prompt"}, "test-key"
+        )
+        for _ in range(4):
+            app["advance_bulk_analysis"](job, "test-key")
+        return job
+
+    def test_waits_for_batch_to_end(self):
+        job = app["start_bulk_analysis"](["Acme"], {"fit": "fit prompt", "pain": "pain prompt"}, "test-key")
+        app["advance_bulk_analysis"](job, "test-key")
+        self.assertEqual(job["stage"], "fit")
+        self.assertEqual(job["fit_results"], {})
+
+    def test_truncated_results_fail_per_company(self):
+        job = self.run_job()
+        self.assertEqual(job["stage"], "done")
+
+        results = {r["company_name"]: r for r in app["get_bulk_results"](job)}
+        self.assertTrue(results["Acme"]["fit_result"]["success"])
+        self.assertTrue(results["Acme"]["pain_result"]["success"])
+
+        cut_off = results["Cut Off"]["fit_result"]
+        self.assertFalse(cut_off["success"])
+        self.assertIn("max_tokens", cut_off["error"])
+
+        partial = results["Partial"]["fit_result"]
+        self.assertFalse(partial["success"])
+        self.assertIn("missing required fields", partial["error"])
+
+    def test_pain_batch_only_covers_good_fits(self):
+        job = self.run_job()
+        pain_batch = self.batches.batches["msgbatch_1"]
+        self.assertEqual([r["custom_id"] for r in pain_batch["requests"]], ["pain-0"])
+        self.assertIsNone(app["get_bulk_results"](job)[1]["pain_result"])
+
+
+class AnalysisStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.store = app["AnalysisStore"]()
+
+    def test_caps_payloads_across_all_sessions(self):
+        cap = app["MAX_STORED_ANALYSES"]
+        for idx in range(cap + 10):
+            self.store.put(f"session-{idx}", "analysis", {"idx": idx})
+        self.assertIsNone(self.store.get("session-0", "analysis"))
+        self.assertEqual(self.store.get(f"session-{cap + 9}", "analysis"), {"idx": cap + 9})
+        self.assertEqual(len(self.store._sessions), cap)
+
+    def test_caps_each_session_at_its_history_length(self):
+        cap = app["MAX_HISTORY_ENTRIES"]
+        for idx in range(cap + 1):
+            self.store.put("busy", f"analysis-{idx}", {})
+        self.store.put("quiet", "analysis-0", {"kept": True})
+        self.assertIsNone(self.store.get("busy", "analysis-0"))
+        self.assertIsNotNone(self.store.get("busy", f"analysis-{cap}"))
+        self.assertEqual(self.store.get("quiet", "analysis-0"), {"kept": True})
+
+    def test_clear_only_drops_that_session(self):
+        self.store.put("a", "analysis-0", {})
+        self.store.put("b", "analysis-0", {})
+        self.store.clear("a")
+        self.assertIsNone(self.store.get("a", "analysis-0"))
+        self.assertIsNotNone(self.store.get("b", "analysis-0"))
+
+
+class ParseCompanyCsvTests(unittest.TestCase):
+    def test_skips_header_row(self):
+        data = b"Company,Website\nAcme,acme.com\n\nGlobex,globex.com\n"
+        self.assertEqual(app["parse_company_csv"](data), ["Acme", "Globex"])
+
+    def test_skips_header_after_byte_order_mark(self):
+        # Excel's "CSV UTF-8" export
+        data = "Company Name\nSociété Générale\n".encode("utf-8-sig")
+        self.assertEqual(app["parse_company_csv"](data), ["Société Générale"])
+
+    def test_keeps_first_row_without_header(self):
+        self.assertEqual(app["parse_company_csv"](b"Acme\nGlobex\n"), ["Acme", "Globex"])
+
+    def test_rejects_non_utf8_file(self):
+        # Excel's default Windows "CSV (Comma delimited)" export
+        data = "Company\nSociété Générale\n".encode("cp1252")
+        with self.assertRaises(UnicodeDecodeError):
+            app["parse_company_csv"](data)
+
+
+class PdfReportWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.writer = app["PdfReportWriter"](io.BytesIO())
+        self.drawn = []
+        draw_string = self.writer.canvas.drawString
+
+        def record(x, y, text, *args, **kwargs):
+            self.drawn.append((x, text))
+            return draw_string(x, y, text, *args, **kwargs)
+
+        self.writer.canvas.drawString = record
+
+    def test_wraps_long_text_within_margins(self):
+        self.writer.paragraph("analytics " * 200)
+        self.assertGreater(len(self.drawn), 1)
+        for _, line in self.drawn:
+            self.assertLessEqual(app["stringWidth"](line, "Helvetica", 11), self.writer.text_width)
+
+    def test_breaks_onto_new_pages(self):
+        for idx in range(100):
+            self.writer.paragraph(f"Line {idx}")
+        self.assertGreater(self.writer.canvas.getPageNumber(), 1)
+        self.assertGreaterEqual(self.writer.y, self.writer.MARGIN_Y)
+
+    def test_draws_markup_characters_verbatim(self):
+        self.writer.paragraph("R&D <pilot> & more", label="Scope:")
+        self.assertEqual([text for _, text in self.drawn], ["Scope:", "R&D <pilot> & more"])
+
+    def test_full_report_with_special_characters(self):
+        fit = complete_fit(brief_company_overview="Tools for R&D teams <beta> " * 40)
+        pdf = app["generate_pdf_report"]("Acme & Sons <Intl>", "2026-01-02 15:04:05", fit, complete_pain()).getvalue()
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+    def test_report_is_dated_with_the_analysis_timestamp(self):
+        paragraphs = []
+
+        class RecordingWriter(app["PdfReportWriter"]):
+            def paragraph(self, text, *args, **kwargs):
+                paragraphs.append(text)
+                return super().paragraph(text, *args, **kwargs)
+
+        original = app["PdfReportWriter"]
+        app["PdfReportWriter"] = RecordingWriter
+        self.addCleanup(app.__setitem__, "PdfReportWriter", original)
+
+        # The timestamp is part of the cache key, so a later analysis of the
+        # same company is not served the earlier report
+        for timestamp in ("2026-01-02 15:04:05", "2026-03-04 09:30:00"):
+            app["generate_pdf_report"]("Dated Co", timestamp, complete_fit(), None)
+        self.assertIn("Generated: January 02, 2026 at 03:04 PM", paragraphs)
+        self.assertIn("Generated: March 04, 2026 at 09:30 AM", paragraphs)
+
+
+if __name__ == "__main__":
+    unittest.main()